@@ -1,10 +1,27 @@
 # -*- coding: utf-8 -*-
-from threading import Lock, Thread
+from collections import deque, namedtuple
+from threading import Event, Thread
 import logging
-import re
-import queue
+import string
 import time
 
+# Use the regex module when it is installed.  It is a drop-in replacement for re
+# that releases the GIL while matching, which helps when several components are
+# processing input at the same time.  The two accept slightly different patterns
+# (regex allows a group name to be repeated) so anything that depends on a pattern
+# being rejected must be checked explicitly rather than left to re.error.
+try:
+    import regex as re
+except ImportError:
+    import re
+
+# Requests sent to a component's writeLoop
+_Request = namedtuple('_Request', 'action property value')
+_EXIT_REQUEST = _Request('EXIT', None, None)
+
+# Events sent to a Thing's main loop.  source is the name of the component that sent the event or '__thing__' for a delta received from the IOT service
+_Event = namedtuple('_Event', 'source action property value')
+
 class Component(object):
     ''' Components are responsible for monitoring the underlying physical component, updating dependent properties associated with the component, and responding to updates of those properties by sending the appropriate commands to the component to get it to update its status to be consistent with its published properties
 
@@ -28,13 +45,17 @@ class Component(object):
         self._queryTiming = queryTiming
         self._synchronous = synchronous
         self.__name__ = name if name is not None else self.__class__.__name__
-        self._componentQueue = queue.Queue()
-        self._readlock = Lock()
+        self._componentQueue = deque() # Requests may be appended by several threads (the Thing or any other caller of updateComponent) but only the writeLoop pops.  A deque's append and popleft are atomic so several producers and a single consumer are safe without a lock
+        self._componentEvent = Event() # Set whenever a message is added to the componentQueue
         self._waitFor = None # Are we waiting for a specific value from the component
         self._exit = False # Set when a request has been made to exit the component driver
+        self._exitEvent = Event() # Set along with _exit so that a writeLoop waiting for the component to become ready wakes up immediately
         self._needQuery = True
         self._lastRequestedStatus = 0
-        self._buffer = b'' # Buffer to hold input from component
+        self._query = None # The last query returned by queryStatus for an asynchronous component
+        self._queryBytes = b'' # and its encoded form
+        self._buffer = bytearray() # Buffer to hold input from component
+        self._readAvailable = hasattr(type(stream), 'in_waiting') # Can the stream tell us how much input is waiting (e.g. pyserial)
 
         self._initializeProperties() # Determine what properties are being handled
 
@@ -77,13 +98,14 @@ class Component(object):
             value (any valid property value): The value the property has changed to
 
         '''
-        self._componentQueue.put({'source': '__thing__', 'action': 'UPDATE', 'property': property, 'value': value })
+        self._componentQueue.append(_Request('UPDATE', property, value))
+        self._componentEvent.set()
 
     def _updateThing(self, property, value):
         ''' Send message to thing telling it to update its properties to reflect the component's reported state '''
-        self._eventQueue.put({'source': self.__name__, 'action': 'UPDATE', 'property': property, 'value': value })
+        self._eventQueue.put(_Event(self.__name__, 'UPDATE', property, value))
 
-        self._logger.info('{0} property change [{1}:{2}]'.format(self.__name__, property, value))
+        self._logger.info('%s property change [%s:%s]', self.__name__, property, value)
 
         # update local property value
         self.properties[property] = value
@@ -91,8 +113,10 @@ class Component(object):
     def exit(self):
         ''' Shut down component driver '''
         self._exit = True
-        self._componentQueue.put({'action': 'EXIT'})
-        self._eventQueue.put({'source': self.__name__, 'action': 'EXIT'})
+        self._exitEvent.set()
+        self._componentQueue.append(_EXIT_REQUEST)
+        self._componentEvent.set()
+        self._eventQueue.put(_Event(self.__name__, 'EXIT', None, None))
 
     @classmethod
     def componentToProperty(cls, property, regex):
@@ -156,7 +180,7 @@ class Component(object):
         def decorateinterface(func):
             transform = getattr(func, '__componentToProperty__', {})
             cre = re.compile(regex)
-            transform[cre] = (property, func)
+            transform[cre] = ((property,) if isinstance(property, str) else tuple(property), func) # Always store a tuple of property names so responses can be processed the same way whether they hold one value or several
             func.__componentToProperty__ = transform
             return func
 
@@ -201,183 +225,292 @@ class Component(object):
 
         return decorateinterface
 
-    @classmethod
-    def _componentToProperty(cls, value):
-        for supercls in cls.__mro__:  # This makes inherited Appliances work
-            for method in supercls.__dict__.values():
-                c2pList = getattr(method, '__componentToProperty__', {})
-                for cre, (property, method) in c2pList.items():
-                    match = cre.match(value)
-                    if match:
-                        return (property, method, match)
+    def _componentToProperty(self, value):
+        ''' Find the componentToProperty method that handles value
+
+        Returns:
+            A tuple of (properties, method, values) where properties is a tuple of the property names handled by method and values holds the match groups extracted from value, or None if no method matches
+        '''
+        if self._c2pRegex is not None:
+            match = self._c2pRegex.match(value)
+            if match:
+                (property, method, start, end) = self._c2pHandlers[match.lastgroup]
+                return (property, method, match.groups()[start:end])
+            return None
+
+        # One or more patterns could not be combined so try each of them in turn
+        for cre, property, method in self._c2pPatterns:
+            match = cre.match(value)
+            if match:
+                return (property, method, match.groups())
         return None
 
     @classmethod
     def _propertyToComponent(cls, property):
-        for supercls in cls.__mro__:  # This makes inherited Appliances work
-            for method in supercls.__dict__.values():
-                p2cList = getattr(method, '__propertyToComponent__', {})
-                if p2cList and property in p2cList:
-                    return p2cList.get(property)
+        return cls._p2cTable.get(property)
 
     def _initializeProperties(self):
+        self._initializeDispatch()
         cls = self.__class__
-        p2cProperties = {}
-        c2pProperties = {}
-        for supercls in cls.__mro__:  # This makes inherited Appliances work
-            for method in supercls.__dict__.values():
-                c2pList = getattr(method, '__componentToProperty__', {})
-                p2cList = getattr(method, '__propertyToComponent__', {})
-                if p2cList:
-                    for k in p2cList:
-                        p2cProperties[k] = None
-                if c2pList:
-                    for cre, (property, method) in c2pList.items():
-                        if type(property) is list:
-                            for p in property:
-                                c2pProperties[p] = None
-                        else:
-                            c2pProperties[property] = None
 
         # Normally, every property should have both a componentToProperty and propertyToComponent method
 
         # Log any properties included in propertyToComponent methods that do not show up in a componentToProperty method
-        for p in { k: p2cProperties[k] for k in p2cProperties if k not in c2pProperties }:
+        for p in cls._noComponentToProperty:
             self._logger.warn('{0} has no componentToProperty method for {1}'.format(self.__name__, p))
 
         # Log any properties included in componentToProperty methods that do not show up in a propertyToComponent method
-        for p in { k: c2pProperties[k] for k in c2pProperties if k not in p2cProperties }:
+        for p in cls._noPropertyToComponent:
             self._logger.warn('{0} has no propertyToComponent method for {1}'.format(self.__name__, p))
 
-        # Combine lists
-        self.properties = p2cProperties
-        for p in c2pProperties:
-            self.properties[p] = c2pProperties[p]
+        self.properties = dict.fromkeys(cls._propertyNames)
+
+    _numberedGroupReference = re.compile(r'\\[1-9]|\\g<[+-]?[0-9]|\(\?\([+-]?[0-9]|\(\?[+-]?[0-9]|\(\?R\)|\(\?P=')
+
+    @classmethod
+    def _initializeDispatch(cls):
+        ''' Build the tables used to dispatch component responses and property updates to their handlers, along with the names of the properties the class handles.  This is done once per class and shared by all of its instances.
+
+        The componentToProperty regexes are combined into a single alternation so that each response from the component is classified with one match call.  Each regex is wrapped in a named group.  The name of the group that matched identifies the method to call and the position of that group identifies where the method's own match groups are within the combined match.
+        '''
+        if '_p2cTable' in cls.__dict__:
+            return
+
+        c2pPatterns = []
+        p2cTable = {}
+        for supercls in cls.__mro__:  # This makes inherited Appliances work
+            for method in supercls.__dict__.values():
+                for cre, (property, func) in getattr(method, '__componentToProperty__', {}).items():
+                    c2pPatterns.append((cre, property, func))
+                for property, (cmd, func) in getattr(method, '__propertyToComponent__', {}).items():
+                    if property not in p2cTable: # The most derived class wins
+                        p2cTable[property] = (cls._compileCommand(cmd), func)
+
+        p2cProperties = dict.fromkeys(p2cTable)
+        c2pProperties = {}
+        for cre, property, func in c2pPatterns:
+            for p in property:
+                c2pProperties[p] = None
+
+        c2pHandlers = {}
+        c2pRegex = None
+
+        # Named groups must be unique within the combined regex (including the _c2pN names added below).  A repeated name would otherwise either fail to compile or, with the regex module, be accepted with the repeats sharing a single group so that a handler's values would be lost
+        groupNames = [ name for cre, property, func in c2pPatterns for name in cre.groupindex ]
+        uniqueNames = len(groupNames) == len(set(groupNames)) and not any(name.startswith('_c2p') for name in groupNames)
+
+        # Anything that refers to a group by number (back-references such as \1 or \g<1>, conditionals such as (?(1)...), and the regex module's (?1) and (?R) calls) is numbered relative to its own regex and would point at the wrong group once combined; named back-references are left to the per-pattern path as well
+        if c2pPatterns and uniqueNames and not any(cls._numberedGroupReference.search(cre.pattern) for cre, property, func in c2pPatterns):
+            alternatives = []
+            for i, (cre, property, func) in enumerate(c2pPatterns):
+                alternatives.append('(?P<_c2p{0}>{1})'.format(i, cre.pattern))
+            try:
+                c2pRegex = re.compile('|'.join(alternatives))
+            except re.error as e: # Should not happen after the checks above but matching individually is always safe
+                cls._logger.debug('{0} unable to combine componentToProperty regexes.  Matching them individually.  Error: {1}'.format(cls.__name__, e))
+
+        if c2pRegex is not None:
+            for i, (cre, property, func) in enumerate(c2pPatterns):
+                name = '_c2p{0}'.format(i)
+                start = c2pRegex.groupindex[name] # match.groups() is zero based so this is the index of the first group within cre
+                c2pHandlers[name] = (property, func, start, start+cre.groups)
+
+        cls._c2pPatterns = c2pPatterns
+        cls._c2pHandlers = c2pHandlers
+        cls._c2pRegex = c2pRegex
+        cls._propertyNames = tuple(p2cProperties) + tuple(p for p in c2pProperties if p not in p2cProperties)
+        cls._noComponentToProperty = tuple(p for p in p2cProperties if p not in c2pProperties)
+        cls._noPropertyToComponent = tuple(p for p in c2pProperties if p not in p2cProperties)
+        # _p2cTable marks the class as initialized so it has to be assigned last, otherwise another thread could see it and use the class before the other attributes exist
+        cls._p2cTable = p2cTable
+
+    @staticmethod
+    def _compileCommand(cmd):
+        ''' Return a function that produces the command (as bytes) to send to the component from the value returned by a propertyToComponent method.
+
+        Most command templates have a single {0} field.  These are split once into the encoded text before and after the field so that the template does not need to be parsed, and only the value needs to be encoded, for every update.  Any other template is left to str.format.
+        '''
+        def formatCommand(value):
+            return cmd.format(value).encode()
+
+        try:
+            parsed = list(string.Formatter().parse(cmd))
+        except ValueError:
+            return formatCommand
+
+        fields = [ i for i, (text, field, spec, conversion) in enumerate(parsed) if field is not None ]
+        if len(fields) != 1:
+            return formatCommand
+        i = fields[0]
+        if parsed[i][1] not in ('0', '') or parsed[i][2] or parsed[i][3]:
+            return formatCommand
+
+        # parse returns each piece of literal text (with doubled braces unescaped) along with the field that follows it, so the text of item i precedes the field and the text of the remaining items follows it
+        prefix = ''.join(item[0] for item in parsed[:i+1]).encode()
+        suffix = ''.join(item[0] for item in parsed[i+1:]).encode()
+        return lambda value: prefix + format(value).encode() + suffix
 
     def _readLoop(self):
         ''' Main event loop for reading from component '''
         self._logger.info('{0} Starting readLoop'.format(self.__name__))
+
+        # Resolve the methods used on every pass once
+        read = self._read
+        processComponentResponse = self._processComponentResponse
+
         while not self._exit:
-            val = self._read()
+            val = read()
             if val:
-                self._processComponentResponse(val)
+                processComponentResponse(val)
         self._logger.info('{0} Exiting readLoop'.format(self.__name__))
 
 
     def _processComponentResponse(self, val):
         ret = self._componentToProperty(val) # Retrieve appropriate handler to translate component value into property value
         if ret:
-            (property, method, match) = ret
-            if type(property) is not list: property = [ property ]
+            (property, method, values) = ret
 
-            for i in range(len(property)):
-                # Extract out each match group and send to method to get it translated from the value from the component to the property value
-                mval = match.group(i+1)
+            properties = self.properties
+            for p, mval in zip(property, values):
+                # Send the match group to method to get it translated from the value from the component to the property value
                 try:
-                    xval = method(self, property[i], mval)
-                    if self.properties[property[i]] != xval:
+                    xval = method(self, p, mval)
+                    if properties[p] != xval:
                         # Send updated property to Thing
-                        self._updateThing(property[i], xval)
+                        self._updateThing(p, xval)
                 except (ValueError, AssertionError, TypeError) as e:
-                    self._logger.warn("{0}'s' attempt to process response to {1} failed.  Error: {2}".format(self.__name__, val, e))
+                    self._logger.warn("%s's' attempt to process response to %s failed.  Error: %s", self.__name__, val, e)
         else:
-            self._logger.debug('{0} has no componentToProperty method that matches input [{1}]'.format(self.__name__, val))
+            self._logger.debug('%s has no componentToProperty method that matches input [%s]', self.__name__, val)
 
     def _writeLoop(self):
         ''' Main event loop for writing to component '''
         self._logger.info('{0} Starting writeLoop'.format(self.__name__))
 
-        while not self._exit:
-            try:
+        # Resolve the objects and methods used on every pass once
+        ready = self.ready
+        sendQuery = self._sendQuery
+        componentQueue = self._componentQueue
+        componentEvent = self._componentEvent
+        propertyToComponent = self._propertyToComponent
+        write = self._write
+        processComponentResponse = self._processComponentResponse
+        properties = self.properties
+        exitEvent = self._exitEvent
 
-                # Wait for ready state to be reached
-                while True:
-                    s = self.ready()
-                    if not s: break
-                    self._logger.debug('{0} waiting for device to be ready.  Sleeping {1} seconds...'.format(self.__name__, s))
-                    time.sleep(s)
-                    raise queue.Empty
-
-                if self._needQuery:
-                    self._needQuery = False
-                    raise queue.Empty
-
-                message = self._componentQueue.get(block=True, timeout=self._queryTiming)
-                self._componentQueue.task_done()
+        while not self._exit:
 
-                if message['action'].upper() == 'EXIT':
+            # If the component is not ready, wait for it and then query it to see whether its state has settled
+            s = ready()
+            if s:
+                self._logger.debug('%s waiting for device to be ready.  Sleeping %s seconds...', self.__name__, s)
+                if exitEvent.wait(s):
                     break
-                elif message['action'].upper() == 'UPDATE':
-                    self._logger.info('{0} received request [{1}:{2}]'.format(self.__name__,message['property'], message['value']))
-                    if self.properties.get(message['property']) == message['value']:
-                        self._logger.debug('{0} already set to [{1}:{2}].  IGNORING'.format(self.__name__,message['property'], message['value']))
-                        continue
+                sendQuery()
+                continue
 
-                    ret = self._propertyToComponent(message['property'])
-                    if ret:
-                        (cmd, method) = ret
+            if self._needQuery:
+                self._needQuery = False
+                sendQuery()
+                continue
 
-                        # Send updated property to component
-                        try:
-                            val = self._write(cmd.format(method(self,message['value'])))
-                        except (ValueError, TypeError, AssertionError) as e:
-                            val = None
-                            self._logger.warn('{0} request failed: {1}'.format(self.__name__,e))
+            if not componentQueue:
+                # Clear the event before checking the queue again so that a message added in between is not missed
+                componentEvent.clear()
+                if not componentQueue and not componentEvent.wait(self._queryTiming):
+                    # Nothing waiting to be written so send a query to get current component status
+                    sendQuery()
+                    continue
+            (action, property, value) = componentQueue.popleft()
 
-                        # If component is synchronous, it likely returned a response from the command we just sent
-                        if val:
-                            # If so, process it
-                            self._processComponentResponse(val)
-                    else:
-                        self._logger.warn('{0} has no method to handle property {1}'.format(self.__name__,message['property']))
-
-            except queue.Empty:
-                # If nothing waiting to be written or the component is not ready, send a query to get current component status
-                qs = self.queryStatus()
-                if qs:
-                    # Get the query to send.  If the query is a list, process each query individually
-                    qs = qs if type(qs) is list else [ qs ]
-                    for q in qs:
-                        val = self._write(q)
-                        if val:
-                            self._processComponentResponse(val)
-
-                continue
+            if action == 'EXIT':
+                break
+            elif action == 'UPDATE':
+                self._logger.info('%s received request [%s:%s]', self.__name__, property, value)
+                if properties.get(property) == value:
+                    self._logger.debug('%s already set to [%s:%s].  IGNORING', self.__name__, property, value)
+                    continue
+
+                ret = propertyToComponent(property)
+                if ret:
+                    (fmt, method) = ret
+
+                    # Send updated property to component
+                    try:
+                        val = write(fmt(method(self,value)))
+                    except (ValueError, TypeError, AssertionError) as e:
+                        val = None
+                        self._logger.warn('%s request failed: %s', self.__name__, e)
+
+                    # If component is synchronous, it likely returned a response from the command we just sent
+                    if val:
+                        # If so, process it
+                        processComponentResponse(val)
+                else:
+                    self._logger.warn('%s has no method to handle property %s', self.__name__, property)
         self._logger.info('{0} Exiting writeLoop'.format(self.__name__))
 
+    def _sendQuery(self):
+        ''' Send the component the query returned by queryStatus '''
+        qs = self.queryStatus()
+        if qs:
+            if self._synchronous:
+                # If the query is a list or tuple, send each query individually and process its response
+                for q in (qs if isinstance(qs, (list, tuple)) else ( qs, )):
+                    val = self._write(q)
+                    if val:
+                        self._processComponentResponse(val)
+            else:
+                # Responses from an asynchronous component are handled by the readLoop so all of the queries can be sent in a single write
+                # queryStatus usually returns one of a few constant values so the encoded query is kept and reused until a different value is returned.  Lists can be changed in place so they are always encoded
+                if qs is not self._query or type(qs) is list:
+                    self._query = qs
+                    self._queryBytes = b''.join(q.encode() if type(q) is str else q for q in (qs if isinstance(qs, (list, tuple)) else ( qs, )))
+                self._write(self._queryBytes)
+
     def _read(self):
-        with self._readlock:
-            return self._readresponse()
+        # No lock is needed.  An asynchronous component is only read from its readLoop and a synchronous component (which has no readLoop) is only read from within _write
+        return self._readresponse()
 
     def _readresponse(self):
-        last_activity = time.time()
+        # Give up when nothing has been received for timeout seconds
+        deadline = time.monotonic() + self._timeout
+        start = 0
 
         while True:
-            c = self._stream.read()
+            # Input is read in blocks so the buffer may already hold a complete response
+            i = self._buffer.find(self._eol, start)
+            if i >= 0:
+                retval = self._buffer[:i]
+                del self._buffer[:i+len(self._eol)]
+                break
+
+            # The buffer holds no eol so only new input (and the end of the current input in case eol is split across reads) needs to be searched next time
+            start = max(0, len(self._buffer)-len(self._eol)+1)
+
+            # Read everything that is waiting in a single call.  If nothing is waiting (or the stream can't say) block on a single byte
+            c = self._stream.read((self._readAvailable and self._stream.in_waiting) or 1)
             if c:
                 self._buffer += c
-                last_activity = time.time()
-                if self._buffer.find(self._eol)>=0:
-                    retval = self._buffer[:self._buffer.find(self._eol)]
-                    self._buffer = self._buffer[len(retval)+len(self._eol):]
-                    break
-            elif time.time() - last_activity > self._timeout:
+                deadline = time.monotonic() + self._timeout
+            elif time.monotonic() > deadline:
                 retval = b''
                 break
+        retval = retval.decode()
         if retval:
-            self._logger.debug('{0} READING [{1}]'.format(self.__name__, retval.decode()))
-        return retval.decode()
+            self._logger.debug('%s READING [%s]', self.__name__, retval)
+        return retval
 
     def _write(self, value):
-        self._logger.debug('{0} WRITING {1}'.format(self.__name__, value.strip(self._eol.decode())))
         value = value.encode() if type(value) is str else value
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug('{0} WRITING {1}'.format(self.__name__, value.strip(self._eol).decode()))
 
         # If component communicates synchronously, after sending request, wait for response
         # reading input until receiving the eol value indicating that it is done responding
         if self._synchronous:
-            with self._readlock:
-                self._stream.write(value)
-                retval = self._readresponse()
+            self._stream.write(value)
+            retval = self._readresponse()
         else:
             self._stream.write(value)
             retval = ''
@@ -398,7 +531,7 @@ class Component(object):
         return False
 
     def queryStatus(self):
-        ''' Override this function if you want to periodically query your component for status.  You can check the component state (such as power status) to determine what query to send.  The response can be either a string or a list of strings.  If you return a list, each list item will be sent to the component individually including gathering and handling any response the query generates.
+        ''' Override this function if you want to periodically query your component for status.  You can check the component state (such as power status) to determine what query to send.  The response can be either a string or a list of strings.  Bytes and tuples are also accepted, which lets you return precomputed class constants.  If you return a list, each list item will be sent to the component.  For a synchronous component each query is sent individually and its response gathered and handled before the next is sent.  For an asynchronous component the queries are sent together in a single write.
 
         **Example:**
 
@@ -6,6 +6,18 @@ import time
 
 from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
 
+from pyIOT.Component import _Event
+
+# Use orjson to decode and encode shadow documents when it is installed.  It is considerably faster than the json module.
+try:
+    import orjson
+    _loads = orjson.loads
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _loads = json.loads # json.loads reuses a module level decoder when called without options
+    _dumps = json.JSONEncoder(separators=(',', ':')).encode # Same compact form as orjson produces.  The encoder is created once as json.dumps builds a new one on every call that passes options
+
 class Thing(object):
     ''' A thing is composed of one or more components that publishes their status to the AWS IOT service in the form of a set of properties and accepts changes to those properties updating the underlying components as needed.
 
@@ -16,7 +28,7 @@ class Thing(object):
             certificatePath (`str`): Path to the file which holds the certificate for your IOT device.  Received from AWS IOT-Core during device creation
             privateKeyPath (`str`): Path to the file which holds the private key for your IOT device.  Received from AWS IOT-Core during device creation
             region (`str`): The name of the AWS region that your IOT device was created in (e.g. 'us-east-1')
-            components (`list` of :obj:`Component`): A list of the component objects that make up the IOT device
+            components (`list` of :obj:`Component`): A list (or tuple) of the component objects that make up the IOT device.  A single component may also be passed on its own
 
     '''
     _logger = logging.getLogger(__name__)
@@ -25,15 +37,22 @@ class Thing(object):
         ''' Initialize connection to AWS IOT shadow service '''
 
         self.__name__ = thingName
-        self._eventQueue = queue.Queue()
+        self._eventQueue = queue.SimpleQueue() # Nothing joins the queue so the task tracking of queue.Queue is not needed
         self._localShadow = dict() # dictionary of local property values
         self._propertyHandlers = dict() # dictionary to set which component handles which property values
+        self._batchWindow = 0.1 # maximum seconds to keep collecting messages after receiving a message so that related updates are processed together
+        self._batchGap = 0.02 # the batch also closes when no further message arrives within this many seconds
+        self._batchMax = 64 # maximum number of messages to process in a single batch
         self._iotConnect(endpoint, thingName, rootCAPath, certificatePath, privateKeyPath, region)
 
-        self._components = components if type(components) is list else [ components ] # Convert components to a list of a single component has been provided
-        if self._components is not None:
-            for d in self._components:
-                self._registerComponent(d)
+        # Accept no components, a single component, or a list or tuple of components
+        if components is None:
+            components = ()
+        elif not isinstance(components, (list, tuple)):
+            components = ( components, )
+        self._components = components
+        for d in self._components:
+            self._registerComponent(d)
 
     def _iotConnect(self, endpoint, thingName, rootCAPath, certificatePath, privateKeyPath, region):
         ''' Establish connection to the AWS IOT service '''
@@ -70,11 +89,11 @@ class Thing(object):
     def _registerComponent(self, component):
         ''' Register a component as the handler for the set of properties that the component implements '''
 
-        for property in component.properties:
-            if property in self._localShadow:
-                self._logger.warn("{0}'s component {1} is trying to register {2} which is a property that is already in use.".format(self.__name__, component.__name__, property))
-            self._localShadow[property] = component.properties[property]
-            self._propertyHandlers[property] = component
+        properties = component.properties
+        for property in self._localShadow.keys() & properties.keys():
+            self._logger.warn("{0}'s component {1} is trying to register {2} which is a property that is already in use.".format(self.__name__, component.__name__, property))
+        self._localShadow.update(properties)
+        self._propertyHandlers.update(dict.fromkeys(properties, component))
         component._start(self._eventQueue)
 
     def _deleteCallback(self, payload, responseStatus, token):
@@ -87,17 +106,17 @@ class Thing(object):
     def _updateCallback(self, payload, responseStatus, token):
         ''' Log result when a request has been made to update the IOT shadow '''
         if responseStatus == 'accepted':
-            payloadDict = json.loads(payload)
             return
 
         self._logger.warn("{0}'s request to update shadow failed.  Reason given: {1}".format(self.__name__, responseStatus))
 
     def _deltaCallback(self, payload, responseStatus, token):
-        ''' Receive an delta message from IOT service and forward update requests for every included property to the event queue '''
-        payloadDict = json.loads(payload)
+        ''' Receive an delta message from IOT service and forward the update requests it contains to the event queue '''
+        payloadDict = _loads(payload)
 
-        for property in payloadDict['state']:
-            self._eventQueue.put({'source': '__thing__', 'action': 'UPDATE', 'property': property, 'value': payloadDict['state'][property] })
+        # The whole delta is sent as one message so that the MQTT callback thread takes the queue lock (and wakes the main loop) once however many properties changed
+        # The event carries no single property.  Its value is the delta's dictionary of property values
+        self._eventQueue.put(_Event('__thing__', 'UPDATE', None, payloadDict['state']))
 
     def start(self):
         ''' Start processing events between the IOT service and the associated components '''
@@ -132,53 +151,67 @@ class Thing(object):
 
     def _main(self):
 
+        # Resolve the objects and methods used for every message once.  The components are registered before the loop starts and the two dictionaries are only ever updated in place
+        get = self._eventQueue.get
+        propertyHandlers = self._propertyHandlers
+        localShadow = self._localShadow
+        monotonic = time.monotonic
+
         while True:
-            messages = [ self._eventQueue.get() ]
-            self._eventQueue.task_done()
-
-            ''' A new message has come in but it may be a batch of updates so wait for a short time and then read all pending messages '''
-            time.sleep(0.1)
-            try:
-                while True:
-                    messages.append( self._eventQueue.get_nowait())
-                    self._eventQueue.task_done()
-            except queue.Empty:
-                pass
+            messages = [ get() ]
+
+            ''' A new message has come in but it may be a batch of updates so keep reading messages until they stop arriving, the batch window closes or the batch is full '''
+            deadline = monotonic() + self._batchWindow
+            while len(messages) < self._batchMax:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    messages.append( get(timeout=min(remaining, self._batchGap)))
+                except queue.Empty:
+                    break
 
             ''' Process all received messages '''
             updatedProperties = dict()
-            for message in messages:
-                if message['action'] == 'EXIT':
+            for (source, action, property, value) in messages:
+                if action == 'EXIT':
                     ''' If an EXIT message is received then stop processing messages and exit the main thing loop '''
                     self._logger.info("{0} is exiting".format(self.__name__))
                     self._iotDisconnect()
                     return
 
-                if message['action'] == 'UPDATE':
-                    if message['source'] == '__thing__':
-                        ''' Update is from IOT service.  Determine which component supports the updated property and send an update request to it '''
-                        self._propertyHandlers[message['property']].updateComponent(message['property'], message['value'])
+                if action == 'UPDATE':
+                    if source == '__thing__':
+                        ''' Update is from IOT service.  For each updated property, determine which component supports it and send an update request to it '''
+                        for p, v in value.items():
+                            propertyHandlers[p].updateComponent(p, v)
                     else:
-                        ''' Update is from component. Add it to updatedProperties '''
-                        updatedProperties[message['property']] = message['value']
-
-                        localPropertyChanges = self.onChange(updatedProperties)
-                        if localPropertyChanges:
-                            for k, v in localPropertyChanges.items():
-                                try:
-                                    self._propertyHandlers[k].updateComponent(k,v)
-                                except KeyError:
-                                    self._logger.warn("{0}'s onChange method requested a change for {1} which is not handled by any component".format(self.__name__,k))
-
-            ''' If there are properties to report to the IOT service, send an update message '''
-            updateNeeded = False
-            payloadDict = { 'state': { 'reported': {}, 'desired': {} } }
-            for property, value in updatedProperties.items():
-                if self._localShadow[property] != value:
-                    self._logger.info('{0} updated IOT [{1}:{2}]'.format(self.__name__, property, value))
-                    self._localShadow[property] = value
-                    updateNeeded = True
-                    payloadDict['state']['reported'] = updatedProperties
-                    payloadDict['state']['desired'] = updatedProperties
-            if updateNeeded:
-                self._shadowHandler.shadowUpdate(json.dumps(payloadDict), self._updateCallback, 5)
+                        ''' Update is from component.  If the value is already what IOT holds there is nothing to report (and any earlier value for the property in this batch is stale) '''
+                        if localShadow.get(property) == value:
+                            updatedProperties.pop(property, None)
+                            continue
+
+                        ''' Add it to updatedProperties '''
+                        updatedProperties[property] = value
+
+            ''' If there are properties to report to the IOT service, call onChange and then send them in a single update message.  Values that match the local shadow were dropped as they were received (and the local shadow does not change until here) so everything left has changed '''
+            if updatedProperties:
+
+                ''' Give onChange a single look at everything that changed in the batch and send any resulting requests to the components '''
+                # The requested values are not added to updatedProperties.  They are only reported once the component confirms that it has made the change
+                localPropertyChanges = self.onChange(updatedProperties)
+                if localPropertyChanges:
+                    for k, v in localPropertyChanges.items():
+                        try:
+                            propertyHandlers[k].updateComponent(k,v)
+                        except KeyError:
+                            self._logger.warn("{0}'s onChange method requested a change for {1} which is not handled by any component".format(self.__name__,k))
+
+                for property, value in updatedProperties.items():
+                    self._logger.info('%s updated IOT [%s:%s]', self.__name__, property, value)
+                localShadow.update(updatedProperties)
+
+                # desired is set along with reported.  A change made at the component (e.g. from its front panel) would otherwise leave the old desired value in the shadow and IOT would send a delta reverting the change
+                # Both hold the same values so they are only serialized once
+                state = _dumps(updatedProperties)
+                self._shadowHandler.shadowUpdate('{"state":{"reported":' + state + ',"desired":' + state + '}}', self._updateCallback, 5)
@@ -25,4 +25,8 @@ setuptools.setup(
           'pyserial',
           'awsiotpythonsdk',
     ],
+    extras_require={
+          'regex': ['regex'],
+          'orjson': ['orjson'],
+    },
 )
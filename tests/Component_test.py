@@ -1,9 +1,11 @@
 import pytest
 import queue
+import sys
 import time
 
 from tests import example
 from tests import simulator
+from pyIOT import Component
 
 @pytest.fixture
 def newpreamp(request):
@@ -24,8 +26,8 @@ def test_preamp_power_on(newpreamp):
     msg = q.get(timeout=2)
     print (msg)
 
-    assert(msg['property']=='powerState')
-    assert(msg['value']=='ON')
+    assert(msg.property=='powerState')
+    assert(msg.value=='ON')
 
 def test_preamp_query_startup(newpreamp):
     q = queue.Queue()
@@ -70,11 +72,97 @@ def test_updateThing(newpreamp):
     newpreamp._start(q)
 
     msg = q.get(timeout=8)
-    assert(msg['property']=='powerState')
-    assert(msg['value']=='OFF')
+    assert(msg.property=='powerState')
+    assert(msg.value=='OFF')
 
     newpreamp._stream.frontPanel('power', True)
 
     msg = q.get(timeout=8)
-    assert(msg['property']=='powerState')
-    assert(msg['value']=='ON')
+    assert(msg.property=='powerState')
+    assert(msg.value=='ON')
+
+def test_componentToProperty_dispatch():
+    preamp = example.preampComponent(name = 'pyIOT_test_preamp', stream = simulator.preampSim())
+
+    (property, method, values) = preamp._componentToProperty('P1S6V-12.5M1D0E0')
+    assert(property==('input', 'volume', 'muted'))
+    assert(values==('6', '-12.5', '1'))
+
+    (property, method, values) = preamp._componentToProperty('P1P1')
+    assert(property==('powerState',))
+    assert(values==('1',))
+
+    assert(preamp._componentToProperty('P1X') is None)
+
+def test_compileCommand():
+    for cmd, value in [ ('P1VM{0}\n', -12.5), ('P1S{}\n', '6'), ('{{P1}}{0}{{', 1), ('{0:+.1f}', 2), ('{0}{0}', 'A') ]:
+        assert(Component._compileCommand(cmd)(value)==cmd.format(value).encode())
+
+def test_componentToProperty_shared_group_name():
+    class sharedNameComponent(Component):
+        @Component.componentToProperty('a', '^A(?P<v>[0-9])$')
+        def toA(self, property, value):
+            return value
+
+        @Component.componentToProperty('b', '^B(?P<v>[0-9])$')
+        def toB(self, property, value):
+            return value
+
+        @Component.propertyToComponent('a', 'A{0}\n')
+        def fromA(self, value):
+            return value
+
+        @Component.propertyToComponent('b', 'B{0}\n')
+        def fromB(self, value):
+            return value
+
+    component = sharedNameComponent(name = 'pyIOT_test_shared', stream = simulator.simulator())
+    assert(component._componentToProperty('A1')[::2]==(('a',), ('1',)))
+    assert(component._componentToProperty('B5')[::2]==(('b',), ('5',)))
+
+def test_componentToProperty_numbered_group_reference():
+    class conditionalComponent(Component):
+        @Component.componentToProperty('a', '^(<)?A([0-9])(?(1)>)$')
+        def toA(self, property, value):
+            return value
+
+        @Component.componentToProperty('b', '^(x)?B([0-9])(?(1)y)$')
+        def toB(self, property, value):
+            return value
+
+        @Component.propertyToComponent('a', 'A{0}\n')
+        def fromA(self, value):
+            return value
+
+        @Component.propertyToComponent('b', 'B{0}\n')
+        def fromB(self, value):
+            return value
+
+    component = conditionalComponent(name = 'pyIOT_test_conditional', stream = simulator.simulator())
+    assert(component._componentToProperty('<A1>')[::2]==(('a',), ('<', '1')))
+    assert(component._componentToProperty('xB1y')[::2]==(('b',), ('x', '1')))
+
+    # \g<1> back-references are only supported by the regex module
+    if sys.modules['pyIOT.Component'].re.__name__ != 'regex':
+        return
+
+    class backReferenceComponent(Component):
+        @Component.componentToProperty('a', '^(a)x\\g<1>([0-9])$')
+        def toA(self, property, value):
+            return value
+
+        @Component.componentToProperty('b', '^B([0-9])$')
+        def toB(self, property, value):
+            return value
+
+        @Component.propertyToComponent('a', 'A{0}\n')
+        def fromA(self, value):
+            return value
+
+        @Component.propertyToComponent('b', 'B{0}\n')
+        def fromB(self, value):
+            return value
+
+    component = backReferenceComponent(name = 'pyIOT_test_backreference', stream = simulator.simulator())
+    assert(component._componentToProperty('axa1')[::2]==(('a',), ('a', '1')))
+    assert(component._componentToProperty('B5')[::2]==(('b',), ('5',)))
@@ -1,28 +1,42 @@
+import bisect
+
 from pyIOT import Thing, Component
 
 
 # For SPHINX: Start preampComponent
 class preampComponent(Component):
 
+    ''' TRANSLATION TABLES '''
+
+    # anthem message values and the property values they correspond to
+    _powerStates = { '1': 'ON', '0': 'OFF' }
+    _powerCodes = { v: k for k, v in _powerStates.items() }
+    _mutedStates = { '1': True, '0': False }
+    _mutedCodes = { v: k for k, v in _mutedStates.items() }
+    _inputs = { '0': 'CD', '1': '2-Ch', '2': '6-Ch', '3': 'TAPE', '4':'RADIO', '5': 'DVD', '6': 'TV', '7': 'SAT', '8': 'VCR', '9': 'AUX' }
+    _inputNumbers = { v: k for k, v in _inputs.items() }
+
     ''' COMPONENT TO PROPERTY METHODS '''
 
     # convert anthem power message into powerState property
     @Component.componentToProperty('powerState', '^P1P([0-1])$')
     def avmToPowerState(self, property, value):
-        val = { '1': 'ON', '0': 'OFF' }.get(value)
-        if val:
-            if val == 'ON' and self.properties['powerState'] == 'OFF':
-                ''' When the preamp turns on, request an immediate status query '''
-                self.requestStatus()
-            return val
-        raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        try:
+            val = self._powerStates[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        if val == 'ON' and self.properties['powerState'] == 'OFF':
+            ''' When the preamp turns on, request an immediate status query '''
+            self.requestStatus()
+        return val
 
     # convert anthem input message into input property
     @Component.componentToProperty('input', '^P1S([0-9])$')
     def avmToInput(self, property, value):
-        val = { '0': 'CD', '1': '2-Ch', '2': '6-Ch', '3': 'TAPE', '4':'RADIO', '5': 'DVD', '6': 'TV', '7': 'SAT', '8': 'VCR', '9': 'AUX' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        try:
+            return self._inputs[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
 
     # convert anthem volume message into volume property
     @Component.componentToProperty('volume', '^P1VM([+-][0-9]{1,2}(?:[\\.][0-9])?)$')
@@ -36,53 +50,61 @@ class preampComponent(Component):
     # convert muted message into muted property
     @Component.componentToProperty('muted', '^P1M([0-1])$')
     def avmToMuted(self, property, value):
-        val = { '1': True, '0': False }.get(value)
-        if val is not None: return val
-        raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        try:
+            return self._mutedStates[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
 
     # This is the response to the query command.  It returns information for several properties
     # Note that we are passing it a list of properties and that the regex has multiple match groups
     @Component.componentToProperty(['input', 'volume', 'muted'], '^P1S([0-9])V([+-][0-9]{1,2}[\\.][0-9])M([0-1])D[0-9]E[0-9]$')
     def avmcombinedResponse(self, property, value):
-        return { 'input': self.avmToInput, 'volume': self.avmToVolume, 'muted': self.avmToMuted }.get(property)(property, value)
+        return self._combinedHandlers[property](self, property, value)
+    _combinedHandlers = { 'input': avmToInput, 'volume': avmToVolume, 'muted': avmToMuted }
 
     ''' PROPERTY TO COMPONENT METHODS '''
 
     # Command preamp to turn on or off
     @Component.propertyToComponent('powerState', 'P1P{0}\n')
     def powerStateToAVM(self, value):
-        val = { 'ON': '1', 'OFF': '0' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid powerState'.format(value))
+        try:
+            return self._powerCodes[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid powerState'.format(value))
 
     # Command preamp to change input
     @Component.propertyToComponent('input', 'P1S{0}\n')
     def inputToAVM(self, value):
-        val = { 'CD': '0', '2-Ch': '1', '6-Ch': '2', 'TAPE': '3', 'RADIO': '4', 'DVD': '5', 'TV': '6', 'SAT': '7', 'VCR': '8', 'AUX': '9' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid input'.format(value))
+        try:
+            return self._inputNumbers[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid input'.format(value))
 
     # Command preamp to change its volume
     @Component.propertyToComponent('volume', 'P1VM{0}\n')
     def volumeToAVM(self, value):
-        if type(value) is int: return self._volumeToDb(value)
+        if type(value) is int: return self._volumeToDb(min(100, max(0, value))) # Keep requests within the 0-100 range of _volArray
         raise ValueError('{0} is not a valid volume'.format(value))
 
     # Command preamp to mute or unmute
     @Component.propertyToComponent('muted', 'P1M{0}\n')
     def muteToAVM(self, value):
-        val = { True: '1', False: '0' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid muted value'.format(value))
+        try:
+            return self._mutedCodes[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid muted value'.format(value))
 
     ''' STATUS QUERY METHOD '''
 
+    _queryOn = b'P1?\n'
+    _queryOff = b'P1P?\n'
+
     def queryStatus(self):
         ''' The preamp only allows you to query its full status when it is on.  When it is off you can only ask for power state '''
         if self.properties['powerState'] == 'ON':
-            return 'P1?\n'
+            return self._queryOn
         else:
-            return 'P1P?\n'
+            return self._queryOff
 
     ''' UTILITY METHODS '''
 
@@ -93,10 +115,7 @@ class preampComponent(Component):
         return float( -1*((100-v)**2.25)/400)+10
 
     ''' compute array of possible volume to db values '''
-    _volArray = []
-    for v in range (0,101):
-      _volArray.append(_computeVolumeToDb.__func__(v))
-    del v
+    _volArray = tuple(map(_computeVolumeToDb.__func__, range(0,101)))
 
     @classmethod
     def _volumeToDb(cls, v):
@@ -107,48 +126,43 @@ class preampComponent(Component):
     def _dbToVolume(cls, db):
         ''' Find the closest db value from volArray and return corresponding volume value '''
         ar = cls._volArray
-        s = 0
-        e = len(ar)-1
-        cp = int(e/2)
-        while True:
-            if e == s: return e
-            if e-s == 1:
-                if db <= ((ar[e] - ar[s])/2)+ar[s]: return s
-                return e
-            if db == ar[cp]: # Exact match.  Got lucky
-                for i in range(cp+1, e+1):
-                    if db < ar[i]: return cp
-                    cp = i
-                return cp
-            if db < ar[cp]: # value is less than the current position
-                if cp == 0: return cp # If we are already at the start of the array then the value is below the lowest value.  Return 0.
-                e = cp
-            if db > ar[cp]: # value is greater than current position
-                if cp == len(ar)-1: return cp # If we are at the end of the array, the value is bigger than the highest value.  Return len of array
-                s = cp
-            cp = int((e-s)/2)+s
+        i = bisect.bisect_left(ar, db)
+        if i == 0: return 0 # value is at or below the lowest value
+        if i == len(ar): return len(ar)-1 # value is bigger than the highest value
+        return i-1 if db - ar[i-1] <= ar[i] - db else i
 # For SPHINX: End preampComponent
 
 # For SPHINX: Start projectorComponent
 class projectorComponent(Component):
 
+    ''' TRANSLATION TABLES '''
+
+    _powerStates = { '00': 'OFF', '01': 'ON', '02': 'WARMING', '03': 'COOLING', '04': 'STANDBY', '05': 'ABNORMAL' }
+    _inputs = { '30': 'HDMI1', 'A0': 'HDMI2', '41': 'VIDEO', '42': 'S-VIDEO' }
+    _inputCodes = { v: k for k, v in _inputs.items() }
+
+    # power states where the projector is running, and where it is able to accept commands
+    _onStates = frozenset(('ON', 'WARMING'))
+    _readyStates = frozenset(('ON', 'WARMING', 'OFF', None))
 
     ''' COMPONENT TO PROPERTY METHODS '''
 
     @Component.componentToProperty('projPowerState', '^PWR=([0-9]{2})\\r?$')
     def toProjPowerState(self, property, value):
-        val = { '00': 'OFF', '01': 'ON', '02': 'WARMING', '03': 'COOLING', '04': 'STANDBY', '05': 'ABNORMAL' }.get(value)
-        if val:
-            if val in ['ON', 'WARMING'] and self.properties['projPowerState'] == 'OFF':
-                self.requestStatus()
-            return val
-        raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        try:
+            val = self._powerStates[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        if val in self._onStates and self.properties['projPowerState'] == 'OFF':
+            self.requestStatus()
+        return val
 
     @Component.componentToProperty('projInput', '^SOURCE=([a-zA-Z0-9]{2})\\r?$')
     def toProjInput(self, property, value):
-        val = { '30': 'HDMI1', 'A0': 'HDMI2', '41': 'VIDEO', '42': 'S-VIDEO' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
+        try:
+            return self._inputs[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid value for property {1}'.format(value, property))
 
     ''' PROPERTY TO COMPONENT METHODS '''
 
@@ -159,32 +173,42 @@ class projectorComponent(Component):
 
     @Component.propertyToComponent('projInput', 'SOURCE {0}\r')
     def projInputToProj(self, value):
-        val = { 'HDMI1': '30', 'HDMI2': 'A0', 'VIDEO': '41', 'S-VIDEO': '42' }.get(value)
-        if val: return val
-        raise ValueError('{0} is not a valid input'.format(value))
+        try:
+            return self._inputCodes[value]
+        except KeyError:
+            raise ValueError('{0} is not a valid input'.format(value))
 
     ''' STATUS QUERY METHOD '''
 
+    _queryOn = (b'PWR?\r', b'SOURCE?\r')
+    _queryOff = b'PWR?\r'
+
     def queryStatus(self):
-        if self.properties['projPowerState'] in ['ON', 'WARMING']:
-            return ['PWR?\r','SOURCE?\r']
+        if self.properties['projPowerState'] in self._onStates:
+            return self._queryOn
         else:
-            return 'PWR?\r'
+            return self._queryOff
 
     ''' READY STATE METHOD '''
 
     def ready(self):
         ''' Projector stops accepting commands while turning on or off (up to 30 seconds) '''
-        return False if self.properties['projPowerState'] in ['ON', 'WARMING', 'OFF', None] else 5
+        return False if self.properties['projPowerState'] in self._readyStates else 5
 # For SPHINX: End projectorComponent
 
 # For SPHINX: Start TVThing
 class TVThing(Thing):
 
+    # preamp inputs that are used for watching video
+    _videoInputs = frozenset(('TV', 'DVD'))
+
     def onChange(self, updatedProperties):
         rv = {}
+        newPowerState = updatedProperties.get('powerState')
+        newInput = updatedProperties.get('input')
+
         # An Alexa dot is connected to the AUX input.  Make sure preamp is always on and set to the AUX input when not doing something else
-        if updatedProperties.get('powerState') == 'OFF':
+        if newPowerState == 'OFF':
             self._logger.info('THING {0} has been turned off.  Turning it back ON and setting input to AUX.'.format(self.__name__))
             rv['powerState'] = 'ON'
             rv['input'] = 'AUX'
@@ -192,15 +216,15 @@ class TVThing(Thing):
             rv['muted'] = False
 
         # If preamp is not set to an input associated with Video, turn projector off
-        if 'input' in updatedProperties and updatedProperties.get('input') not in ['TV', 'DVD']:
+        if 'input' in updatedProperties and newInput not in self._videoInputs:
             self._logger.info('THING {0} turning projector off.'.format(self.__name__))
             rv['projPowerState'] = 'OFF'
 
         # If preamp is set to an input associated with Video, turn projector on and set to correct projector input for the chosen preamp input
-        if self._localShadow.get('powerState') == 'ON' and updatedProperties.get('input') in ['TV', 'DVD']:
+        if self._localShadow.get('powerState') == 'ON' and newInput in self._videoInputs:
             self._logger.info('THING {0} turning projector on.'.format(self.__name__))
             rv['projPowerState'] = 'ON'
-            if updatedProperties.get('input') == 'TV':
+            if newInput == 'TV':
                 rv['projInput'] = 'HDMI1'
             else:
                 rv['projInput'] = 'HDMI2'